@@ -8,6 +8,12 @@ __version__ = "1.0.0"
 __author__ = "JFrog Evidence Demo"
 __email__ = "demo@jfrog.com"
 
-from .simple_app import app
-
 __all__ = ["app"]
+
+
+def __getattr__(name):
+    # Import the app on first access so importing the package stays cheap
+    if name == "app":
+        from .simple_app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,28 +4,56 @@ Dependency Analysis Script for AI Translate Service
 Analyzes package sizes and suggests optimizations to reduce disk space usage.
 """
 
-import subprocess
-import sys
+import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import PackageNotFoundError, distribution
 from pathlib import Path
 
 def get_package_info(package_name):
-    """Get package information using pip show"""
+    """Get package information from the installed distribution metadata"""
     try:
-        result = subprocess.run(
-            [sys.executable, "-m", "pip", "show", package_name],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        info = {}
-        for line in result.stdout.split('\n'):
-            if ':' in line:
-                key, value = line.split(':', 1)
-                info[key.strip()] = value.strip()
-        return info
-    except subprocess.CalledProcessError:
+        dist = distribution(package_name)
+    except PackageNotFoundError:
         return None
+    return {"Version": dist.version, "Location": str(dist.locate_file(""))}
+
+def _dir_size(root):
+    """Total size in bytes of the files under root, stat-ing each entry once"""
+    total = 0
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+def _scan_one(package):
+    """Collect version, location and size details for one package"""
+    info = get_package_info(package)
+    if not info:
+        return None
+    
+    location = info.get('Location', 'Unknown')
+    size_mb = 0
+    
+    # Calculate package size
+    if location != 'Unknown':
+        try:
+            size_bytes = _dir_size(location)
+            size_mb = size_bytes / (1024 * 1024)
+        except OSError:
+            size_mb = 0
+    
+    return {
+        'name': package,
+        'version': info.get('Version', 'Unknown'),
+        'size_mb': size_mb,
+        'location': location
+    }
 
 def analyze_requirements(requirements_file):
     """Analyze requirements file and get package sizes"""
@@ -42,35 +70,11 @@ def analyze_requirements(requirements_file):
     print(f"📦 Analyzing {len(packages)} packages from {requirements_file}")
     print("=" * 80)
     
-    total_size = 0
-    package_details = []
-    
-    for package in packages:
-        info = get_package_info(package)
-        if info:
-            location = info.get('Location', 'Unknown')
-            size_mb = 0
-            
-            # Calculate package size
-            if location != 'Unknown':
-                try:
-                    import os
-                    size_bytes = sum(
-                        os.path.getsize(os.path.join(dirpath, filename))
-                        for dirpath, dirnames, filenames in os.walk(location)
-                        for filename in filenames
-                    )
-                    size_mb = size_bytes / (1024 * 1024)
-                except:
-                    size_mb = 0
-            
-            package_details.append({
-                'name': package,
-                'version': info.get('Version', 'Unknown'),
-                'size_mb': size_mb,
-                'location': location
-            })
-            total_size += size_mb
+    # Package lookups are independent and mostly waiting on the filesystem,
+    # so scan them concurrently
+    with ThreadPoolExecutor() as executor:
+        package_details = [d for d in executor.map(_scan_one, packages) if d]
+    total_size = sum(pkg['size_mb'] for pkg in package_details)
     
     # Sort by size (largest first)
     package_details.sort(key=lambda x: x['size_mb'], reverse=True)
@@ -1,8 +1,11 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 import logging
+import os
 from translation_service import TranslationService
 
 # Configure logging
@@ -24,8 +27,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize translation service
-translation_service = TranslationService()
+# Initialize translation service; the batching knobs match simple_app.py
+translation_service = TranslationService(
+    max_batch_size=max(1, int(os.getenv("TRANSLATE_MAX_BATCH", "16"))),
+    max_wait_ms=float(os.getenv("TRANSLATE_BATCH_WAIT_MS", "5"))
+)
 
 class TranslationRequest(BaseModel):
     text: str
@@ -54,6 +60,11 @@ async def startup_event():
     await translation_service.initialize()
     logger.info("Translation service started successfully!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the translation service background tasks"""
+    await translation_service.shutdown()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -94,6 +105,38 @@ async def translate_text(request: TranslationRequest):
         logger.error(f"Translation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Translation failed: {str(e)}")
 
+@app.post("/translate/stream")
+async def translate_text_stream(request: TranslationRequest):
+    """Stream a translation from English to French as server-sent events"""
+    if not translation_service.is_initialized():
+        raise HTTPException(status_code=503, detail="Translation service not ready")
+    
+    try:
+        pieces = translation_service.translate_stream(
+            request.text,
+            request.source_lang,
+            request.target_lang
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Translation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Translation failed: {str(e)}")
+    
+    async def events():
+        # Headers are already sent once streaming starts, so failures become an
+        # error event instead of an HTTP status
+        try:
+            async for piece in pieces:
+                yield f"data: {json.dumps({'text': piece})}\n\n"
+        except Exception as e:
+            logger.error(f"Streamed translation error: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': f'Translation failed: {str(e)}'})}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.post("/translate/batch", response_model=BatchTranslationResponse)
 async def translate_batch(request: BatchTranslationRequest):
     """Translate multiple texts from English to French"""
@@ -101,19 +144,21 @@ async def translate_batch(request: BatchTranslationRequest):
         if not translation_service.is_initialized():
             raise HTTPException(status_code=503, detail="Translation service not ready")
         
-        translations = []
-        for text in request.texts:
-            translated_text = await translation_service.translate(
-                text, 
-                request.source_lang, 
-                request.target_lang
-            )
-            translations.append(TranslationResponse(
+        translated_texts = await translation_service.translate_batch(
+            request.texts, 
+            request.source_lang, 
+            request.target_lang
+        )
+        
+        translations = [
+            TranslationResponse(
                 original_text=text,
                 translated_text=translated_text,
                 source_lang=request.source_lang,
                 target_lang=request.target_lang
-            ))
+            )
+            for text, translated_text in zip(request.texts, translated_texts)
+        ]
         
         return BatchTranslationResponse(translations=translations)
     except Exception as e:
@@ -0,0 +1,207 @@
+"""
+Inference building blocks shared by simple_app.py and translation_service.py
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from contextlib import contextmanager, nullcontext
+from typing import Callable, List, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """Thread-safe LRU mapping with hit and miss counters"""
+    
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+    
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "maxsize": self.maxsize,
+                "currsize": len(self._entries),
+            }
+
+class DynamicBatcher:
+    """Coalesces concurrent single-text requests into one batched model call"""
+    
+    def __init__(self, translate_batch: Callable[[List[str]], List[str]], executor: Executor,
+                 max_batch: int = 16, max_wait: float = 0.005):
+        self.translate_batch = translate_batch
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start the background batching task on the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the background batching task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def submit(self, text: str) -> str:
+        """Queue a text and wait for its translation"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            
+            # Gather whatever else arrives within the wait window
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            texts = [text for text, _ in items]
+            try:
+                results = await loop.run_in_executor(self.executor, self.translate_batch, texts)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+def generation_kwargs(max_new_tokens: int, num_beams: int = 1) -> dict:
+    """generate() settings: greedy decoding unless beam search is asked for"""
+    kwargs = {
+        "max_new_tokens": max_new_tokens,
+        "num_beams": num_beams,
+        "do_sample": False,
+        "use_cache": True,
+    }
+    if num_beams > 1:
+        kwargs["early_stopping"] = True
+    return kwargs
+
+def autocast(bf16: bool):
+    """BF16 autocast context on CPU; token ids stay int64 either way"""
+    if bf16:
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return nullcontext()
+
+def model_cache_path(kind: str, model_name: str, default_dir: Optional[str] = None) -> str:
+    """Directory holding the converted artifacts of a model
+    
+    TRANSLATE_CACHE_DIR wins when set; otherwise default_dir, then ~/.cache/translate.
+    """
+    base_dir = (
+        os.getenv("TRANSLATE_CACHE_DIR")
+        or default_dir
+        or os.path.join(os.path.expanduser("~"), ".cache", "translate")
+    )
+    return os.path.join(base_dir, kind, model_name.replace("/", "--"))
+
+@contextmanager
+def staged_directory(output_dir: str):
+    """Build a directory under a temporary name and move it into place once complete"""
+    parent = os.path.dirname(output_dir)
+    os.makedirs(parent, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=parent)
+    try:
+        yield staging_dir
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    
+    # Drop whatever an interrupted run without staging left behind
+    shutil.rmtree(output_dir, ignore_errors=True)
+    try:
+        os.replace(staging_dir, output_dir)
+    except OSError:
+        # Another worker moved its copy into place first
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if not os.path.isdir(output_dir):
+            raise
+
+def load_onnx_int8(model_name: str, output_dir: str, quantization_config, token: Optional[str] = None,
+                   session_options=None):
+    """Load an INT8 ONNX Runtime model, exporting and quantizing it on first use"""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    
+    onnx_files = ["encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx"]
+    quantized_files = [name.replace(".onnx", "_quantized.onnx") for name in onnx_files]
+    
+    # The decoder with past is optional; the encoder and decoder are required
+    if not all(os.path.exists(os.path.join(output_dir, name)) for name in quantized_files[:2]):
+        logger.info(f"Exporting {model_name} to ONNX in {output_dir}...")
+        
+        # Export and quantize under a staging name so a run killed halfway
+        # never leaves a directory that looks complete
+        with staged_directory(output_dir) as staging_dir:
+            ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, token=token).save_pretrained(staging_dir)
+            
+            for file_name in onnx_files:
+                if os.path.exists(os.path.join(staging_dir, file_name)):
+                    quantizer = ORTQuantizer.from_pretrained(staging_dir, file_name=file_name)
+                    quantizer.quantize(save_dir=staging_dir, quantization_config=quantization_config)
+    
+    decoder_with_past = quantized_files[2]
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        output_dir,
+        encoder_file_name=quantized_files[0],
+        decoder_file_name=quantized_files[1],
+        decoder_with_past_file_name=decoder_with_past,
+        use_cache=os.path.exists(os.path.join(output_dir, decoder_with_past)),
+        provider="CPUExecutionProvider",
+        session_options=session_options,
+    )
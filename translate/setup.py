@@ -1,7 +1,10 @@
+import mmap
+
 from setuptools import setup, find_packages
 
-with open("README.md", "r", encoding="utf-8") as fh:
-    long_description = fh.read()
+with open("README.md", "rb") as fh:
+    with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        long_description = mm[:].decode("utf-8")
 
 setup(
     name="translation-service",
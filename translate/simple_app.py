@@ -4,7 +4,19 @@ from pydantic import BaseModel
 from typing import List, Optional
 import logging
 import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import torch
 from transformers import MarianMTModel, MarianTokenizer
+try:
+    from .inference_utils import (
+        DynamicBatcher, LRUCache, autocast, generation_kwargs, load_onnx_int8, model_cache_path, staged_directory
+    )
+except ImportError:
+    # Run from inside translate/ (uvicorn simple_app:app, the tests)
+    from inference_utils import (
+        DynamicBatcher, LRUCache, autocast, generation_kwargs, load_onnx_int8, model_cache_path, staged_directory
+    )
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -48,49 +60,237 @@ class BatchTranslationResponse(BaseModel):
 # Global variables for the models
 models = {}
 tokenizers = {}
+translators = {}
 models_loaded = False
 
+# Models available per target language
+_MODEL_CONFIGS = {
+    "fr": "Helsinki-NLP/opus-mt-en-fr",
+    "he": "Helsinki-NLP/opus-mt-en-he"
+}
+_loaded_languages = set()
+_model_locks = {}
+
+# Set TRANSLATE_COMPILE=1 to torch.compile the model forward pass (needs a recent PyTorch)
+TRANSLATE_COMPILE = os.getenv("TRANSLATE_COMPILE", "0") == "1"
+
+# Models are loaded on first use unless TRANSLATE_EAGER_LOAD=1. Compiling implies
+# eager loading, so compilation and its warm-up happen at startup rather than
+# inside the first request for each language
+TRANSLATE_EAGER_LOAD = os.getenv("TRANSLATE_EAGER_LOAD", "0") == "1" or TRANSLATE_COMPILE
+
+# Inference backend: "torch" (default), "ctranslate2" or "onnx"
+TRANSLATE_BACKEND = os.getenv("TRANSLATE_BACKEND", "torch").lower()
+
+# Set TRANSLATE_QUANT=int8 to apply dynamic INT8 quantization to the models
+TRANSLATE_QUANT = os.getenv("TRANSLATE_QUANT", "").lower()
+
+# Set TRANSLATE_DTYPE=bfloat16 to run the models in BF16 (ignored with INT8 quantization)
+TRANSLATE_DTYPE = os.getenv("TRANSLATE_DTYPE", "float32").lower()
+USE_BF16 = TRANSLATE_DTYPE == "bfloat16" and TRANSLATE_QUANT != "int8"
+
+# Inference runs on a small dedicated pool instead of the default executor, and
+# torch splits the cores between its workers to avoid thread oversubscription
+TRANSLATE_INFER_WORKERS = max(1, int(os.getenv("TRANSLATE_INFER_WORKERS", "1")))
+_INFER_POOL = ThreadPoolExecutor(max_workers=TRANSLATE_INFER_WORKERS, thread_name_prefix="translate")
+
+# Concurrent single-text requests are coalesced into batches of up to
+# TRANSLATE_MAX_BATCH texts, waiting at most TRANSLATE_BATCH_WAIT_MS for company
+TRANSLATE_MAX_BATCH = max(1, int(os.getenv("TRANSLATE_MAX_BATCH", "16")))
+TRANSLATE_BATCH_WAIT_MS = float(os.getenv("TRANSLATE_BATCH_WAIT_MS", "5"))
+
+# LRU cache of translations keyed on (text, target_lang)
+_translation_cache = LRUCache(maxsize=4096)
+
+def _batch_translator(lang_code: str):
+    """Batch translation function for one language, as run by its batcher"""
+    return lambda texts: _translate_batch_sync(texts, lang_code)
+
+_batchers = {
+    lang_code: DynamicBatcher(
+        _batch_translator(lang_code), _INFER_POOL, TRANSLATE_MAX_BATCH, TRANSLATE_BATCH_WAIT_MS / 1000
+    )
+    for lang_code in _MODEL_CONFIGS
+}
+
 async def load_models():
     """Load the Hugging Face models asynchronously"""
     global models, tokenizers, models_loaded
     try:
-        logger.info("Loading translation models...")
-        
         # Run model loading in a thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, _load_models_sync)
+        loop = asyncio.get_running_loop()
+        if TRANSLATE_EAGER_LOAD:
+            logger.info("Loading translation models...")
+            await loop.run_in_executor(None, _load_models_sync)
+            logger.info("All models loaded successfully!")
+        else:
+            await loop.run_in_executor(None, _configure_torch)
+            logger.info("Translation models will be loaded on first use")
         
         models_loaded = True
-        logger.info("All models loaded successfully!")
         
     except Exception as e:
         logger.error(f"Failed to load models: {str(e)}")
         raise
 
+async def get_model(lang_code: str):
+    """Make sure the model for a language is loaded, loading it on first use"""
+    if lang_code in _loaded_languages:
+        return
+    
+    # One lock per language so concurrent first requests load the model only once
+    lock = _model_locks.setdefault(lang_code, asyncio.Lock())
+    async with lock:
+        if lang_code in _loaded_languages:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _load_model_sync, lang_code)
+
+def _configure_torch():
+    """Apply the process-wide torch settings used for inference"""
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // TRANSLATE_INFER_WORKERS))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before any inter-op parallel work has started
+        logger.warning("Could not set the number of inter-op threads")
+    
+    if TRANSLATE_QUANT == "int8":
+        if "onednn" in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = "onednn"
+    
+    if USE_BF16:
+        torch.set_float32_matmul_precision("medium")
+
 def _load_models_sync():
-    """Load the models synchronously"""
+    """Load the models for all languages synchronously"""
+    _configure_torch()
+    for lang_code in _MODEL_CONFIGS:
+        _load_model_sync(lang_code)
+
+def _load_model_sync(lang_code: str):
+    """Load the model for one language synchronously"""
     global models, tokenizers
     
-    # Define the models to load
-    model_configs = {
-        "fr": "Helsinki-NLP/opus-mt-en-fr",
-        "he": "Helsinki-NLP/opus-mt-en-he"
-    }
+    model_name = _MODEL_CONFIGS[lang_code]
+    logger.info(f"Loading {model_name} for {lang_code}...")
     
-    for lang_code, model_name in model_configs.items():
-        logger.info(f"Loading {model_name} for {lang_code}...")
-        
-        # Load tokenizer and model
-        tokenizers[lang_code] = MarianTokenizer.from_pretrained(model_name)
-        models[lang_code] = MarianMTModel.from_pretrained(model_name)
+    # Load tokenizer and model
+    tokenizers[lang_code] = MarianTokenizer.from_pretrained(model_name)
+    
+    if TRANSLATE_BACKEND == "ctranslate2":
+        translators[lang_code] = _load_ct2_translator(model_name)
+        _loaded_languages.add(lang_code)
+        logger.info(f"CTranslate2 translator for {lang_code} loaded successfully!")
+        return
+    
+    if TRANSLATE_BACKEND == "onnx":
+        models[lang_code] = _load_onnx_model(model_name)
+        _loaded_languages.add(lang_code)
+        logger.info(f"ONNX Runtime model for {lang_code} loaded successfully!")
+        return
+    
+    model = _load_torch_model(model_name, torch.bfloat16 if USE_BF16 else torch.float32)
+    
+    # Set model to evaluation mode and drop autograd tracking of the weights
+    model.eval()
+    model.requires_grad_(False)
+    
+    if TRANSLATE_QUANT == "int8":
+        _quantize_model(model)
+        logger.info(f"Model for {lang_code} quantized to INT8")
+    
+    models[lang_code] = model
+    
+    if TRANSLATE_COMPILE:
+        # Compile forward rather than the module: generate() is looked up on
+        # the original model and would bypass a compiled wrapper
+        eager_forward = model.forward
+        model.forward = torch.compile(
+            eager_forward, mode="reduce-overhead", dynamic=True, fullgraph=False
+        )
         
-        # Set model to evaluation mode
-        models[lang_code].eval()
+        # Trigger compilation now so the first real request does not pay for it;
+        # compiler errors only surface on this first call
+        logger.info(f"Warming up compiled model for {lang_code}...")
+        try:
+            _translate_batch_sync(["Hello world"], lang_code)
+        except Exception as e:
+            logger.warning(f"torch.compile failed for {lang_code}, using eager mode: {e}")
+            model.forward = eager_forward
+            _translate_batch_sync(["Hello world"], lang_code)
+    
+    _loaded_languages.add(lang_code)
+    logger.info(f"Model for {lang_code} loaded successfully!")
+
+def _load_torch_model(model_name: str, torch_dtype: torch.dtype = torch.float32) -> MarianMTModel:
+    """Load a MarianMT model, keeping a local safetensors copy for later startups"""
+    # safetensors files are memory-mapped, so weights are paged in on demand and
+    # the page cache is shared between workers instead of copied into each heap
+    kind = "safetensors-bf16" if torch_dtype == torch.bfloat16 else "safetensors"
+    local_dir = model_cache_path(kind, model_name)
+    if os.path.exists(os.path.join(local_dir, "model.safetensors")):
+        return MarianMTModel.from_pretrained(
+            local_dir, low_cpu_mem_usage=True, use_safetensors=True, torch_dtype=torch_dtype
+        )
+    
+    model = MarianMTModel.from_pretrained(model_name, low_cpu_mem_usage=True, torch_dtype=torch_dtype)
+    try:
+        # Save under a staging name so an interrupted save never leaves a
+        # truncated model.safetensors for the next startup to load
+        with staged_directory(local_dir) as staging_dir:
+            model.save_pretrained(staging_dir, safe_serialization=True)
+    except OSError as e:
+        logger.warning(f"Could not cache safetensors weights for {model_name}: {e}")
+    return model
+
+def _load_ct2_translator(model_name: str):
+    """Load a CTranslate2 INT8 translator, converting the checkpoint on first use"""
+    import ctranslate2
+    from ctranslate2.converters import TransformersConverter
+    
+    output_dir = model_cache_path("ct2", model_name)
+    if not os.path.exists(os.path.join(output_dir, "model.bin")):
+        logger.info(f"Converting {model_name} to CTranslate2 format in {output_dir}...")
         
-        logger.info(f"Model for {lang_code} loaded successfully!")
+        # Convert under a staging name so an interrupted conversion never leaves
+        # a model.bin without the rest of the model next to it
+        with staged_directory(output_dir) as staging_dir:
+            TransformersConverter(model_name).convert(staging_dir, quantization="int8", force=True)
+    
+    return ctranslate2.Translator(
+        output_dir,
+        device="cpu",
+        compute_type="int8",
+        inter_threads=1,
+        intra_threads=os.cpu_count() or 1,
+    )
 
-async def translate_text_ai(text: str, source_lang: str = "en", target_lang: str = "fr") -> str:
-    """Real AI translation using Helsinki-NLP models"""
+def _load_onnx_model(model_name: str):
+    """Load an INT8 ONNX Runtime model, exporting and quantizing it on first use"""
+    from onnxruntime.quantization import QuantFormat, QuantizationMode, QuantType
+    from optimum.onnxruntime.configuration import QuantizationConfig
+    
+    quantization_config = QuantizationConfig(
+        is_static=False,
+        format=QuantFormat.QOperator,
+        mode=QuantizationMode.IntegerOps,
+        activations_dtype=QuantType.QUInt8,
+        weights_dtype=QuantType.QInt8,
+        per_channel=False,
+    )
+    return load_onnx_int8(model_name, model_cache_path("onnx", model_name), quantization_config)
+
+def _quantize_model(model: MarianMTModel) -> MarianMTModel:
+    """Quantize the Linear layers of a model to INT8 in place"""
+    # Dynamic quantization stores the Linear weights as int8 and quantizes
+    # activations on the fly, so matmuls run on the int8 GEMM kernels
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+
+def _validate_request(source_lang: str, target_lang: str):
+    """Check that the models are ready and the language pair is supported"""
     if not models_loaded:
         raise RuntimeError("Models not loaded")
     
@@ -99,43 +299,113 @@ async def translate_text_ai(text: str, source_lang: str = "en", target_lang: str
     
     if target_lang not in ["fr", "he"]:
         raise ValueError("Currently only French (fr) and Hebrew (he) target languages are supported")
+
+async def translate_text_ai(text: str, source_lang: str = "en", target_lang: str = "fr") -> str:
+    """Real AI translation using Helsinki-NLP models"""
+    _validate_request(source_lang, target_lang)
+    
+    await get_model(target_lang)
     
     try:
-        # Run translation in a thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        translated_text = await loop.run_in_executor(None, _translate_sync, text, target_lang)
+        # Repeated inputs skip the model entirely
+        translated_text = _translation_cache.get((text, target_lang))
+        if translated_text is not None:
+            return translated_text
+        
+        # Queue the text so it shares a model call with concurrent requests
+        translated_text = await _batchers[target_lang].submit(text)
+        _translation_cache.put((text, target_lang), translated_text)
         return translated_text
         
     except Exception as e:
         logger.error(f"Translation error: {str(e)}")
         raise
 
-def _translate_sync(text: str, target_lang: str) -> str:
-    """Perform the actual translation synchronously"""
+async def translate_batch_ai(texts: List[str], source_lang: str = "en", target_lang: str = "fr") -> List[str]:
+    """Translate several texts with a single model call"""
+    _validate_request(source_lang, target_lang)
+    
+    if not texts:
+        return []
+    
+    await get_model(target_lang)
+    
+    try:
+        # Only translate each distinct text once and scatter the results back
+        unique_texts = list(dict.fromkeys(texts))
+        
+        # Run the whole batch in one thread pool task
+        loop = asyncio.get_running_loop()
+        unique_translations = await loop.run_in_executor(
+            _INFER_POOL, _translate_batch_sync, unique_texts, target_lang
+        )
+        
+        translations = dict(zip(unique_texts, unique_translations))
+        return [translations[text] for text in texts]
+        
+    except Exception as e:
+        logger.error(f"Batch translation error: {str(e)}")
+        raise
+
+def _translate_batch_sync(texts: List[str], target_lang: str) -> List[str]:
+    """Translate a padded batch of texts in a single generate call"""
     try:
-        # Get the appropriate model and tokenizer for the target language
+        if TRANSLATE_BACKEND == "ctranslate2":
+            return _translate_ct2_sync(texts, target_lang)
+        
         model = models[target_lang]
         tokenizer = tokenizers[target_lang]
         
-        # Prepare the input for the model using the method you specified
-        tokenized_text = tokenizer.prepare_seq2seq_batch(text, return_tensors="pt")
+        # Pad to the longest text so the whole batch goes through one forward pass
+        encoded = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
         
-        # Generate the translation using the model with max_new_tokens to avoid deprecation warning
-        translated_tokens = model.generate(**tokenized_text, max_new_tokens=512)
-        
-        # Decode the translated tokens back into human-readable text
-        translated_text = tokenizer.batch_decode(translated_tokens, skip_special_tokens=True)[0]
+        with torch.inference_mode(), autocast(USE_BF16):
+            translated_tokens = model.generate(
+                **encoded, **generation_kwargs(_max_new_tokens(encoded["input_ids"].shape[1]))
+            )
         
-        return translated_text
+        return tokenizer.batch_decode(translated_tokens, skip_special_tokens=True)
         
     except Exception as e:
-        logger.error(f"Error during translation: {str(e)}")
+        logger.error(f"Error during batch translation: {str(e)}")
         raise
 
+def _max_new_tokens(input_len: int) -> int:
+    """Decoding budget proportional to the input length instead of a blanket 512"""
+    return min(512, int(1.5 * input_len) + 8)
+
+def _translate_ct2_sync(texts: List[str], target_lang: str) -> List[str]:
+    """Translate texts with the CTranslate2 engine"""
+    tokenizer = tokenizers[target_lang]
+    
+    # CTranslate2 works on subword tokens rather than ids
+    source_tokens = [
+        tokenizer.convert_ids_to_tokens(tokenizer.encode(text, truncation=True, max_length=512))
+        for text in texts
+    ]
+    results = translators[target_lang].translate_batch(
+        source_tokens,
+        beam_size=1,
+        max_decoding_length=_max_new_tokens(max(len(tokens) for tokens in source_tokens)),
+    )
+    
+    return [
+        tokenizer.decode(tokenizer.convert_tokens_to_ids(result.hypotheses[0]), skip_special_tokens=True)
+        for result in results
+    ]
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the translation models on startup"""
     await load_models()
+    for batcher in _batchers.values():
+        batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the request batchers"""
+    for batcher in _batchers.values():
+        await batcher.stop()
 
 @app.get("/")
 async def root():
@@ -151,10 +421,19 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "models_loaded": models_loaded,
-        "models": ["Helsinki-NLP/opus-mt-en-fr", "Helsinki-NLP/opus-mt-en-he"]
+        # With lazy loading the service is up before any model is in memory
+        "models_loaded": _loaded_languages >= set(_MODEL_CONFIGS),
+        "models": ["Helsinki-NLP/opus-mt-en-fr", "Helsinki-NLP/opus-mt-en-he"],
+        "loaded_languages": sorted(_loaded_languages),
+        "translation_cache": _translation_cache.info()
     }
 
+@app.post("/cache/clear")
+async def clear_cache():
+    """Clear the translation cache"""
+    _translation_cache.clear()
+    return {"message": "Translation cache cleared"}
+
 @app.post("/translate", response_model=TranslationResponse)
 async def translate_text(request: TranslationRequest):
     """Translate a single text from English to French or Hebrew"""
@@ -213,19 +492,21 @@ async def translate_batch(request: BatchTranslationRequest):
         if not models_loaded:
             raise HTTPException(status_code=503, detail="Translation service not ready")
         
-        translations = []
-        for text in request.texts:
-            translated_text = await translate_text_ai(
-                text, 
-                request.source_lang, 
-                request.target_lang
-            )
-            translations.append(TranslationResponse(
+        translated_texts = await translate_batch_ai(
+            request.texts, 
+            request.source_lang, 
+            request.target_lang
+        )
+        
+        translations = [
+            TranslationResponse(
                 original_text=text,
                 translated_text=translated_text,
                 source_lang=request.source_lang,
                 target_lang=request.target_lang
-            ))
+            )
+            for text, translated_text in zip(request.texts, translated_texts)
+        ]
         
         return BatchTranslationResponse(translations=translations)
     except Exception as e:
@@ -3,95 +3,176 @@
 Test script for the translation service
 """
 
+import argparse
 import asyncio
 import aiohttp
 import json
 import time
+from contextlib import asynccontextmanager
 
-async def test_translation_service():
-    """Test the translation service endpoints"""
-    
-    base_url = "http://localhost:8002"
+BASE_URL = "http://localhost:8002"
+
+class _HttpxResponse:
+    """Expose an httpx response through the aiohttp response methods the tests use"""
     
-    async with aiohttp.ClientSession() as session:
+    def __init__(self, response):
+        self._response = response
+        self.status = response.status_code
         
-        # Test 1: Health check
+        # httpx reports e.g. "HTTP/2" where aiohttp has HttpVersion(2, 0)
+        major, _, minor = response.http_version.removeprefix("HTTP/").partition(".")
+        self.version = aiohttp.HttpVersion(int(major), int(minor or 0))
+    
+    async def json(self):
+        return self._response.json()
+    
+    async def text(self):
+        return self._response.text
+
+
+class _HttpxSession:
+    """Expose an httpx client through the aiohttp session methods the tests use"""
+    
+    def __init__(self, client):
+        self._client = client
+    
+    @asynccontextmanager
+    async def get(self, url, **kwargs):
+        yield _HttpxResponse(await self._client.get(url, **kwargs))
+    
+    @asynccontextmanager
+    async def post(self, url, **kwargs):
+        yield _HttpxResponse(await self._client.post(url, **kwargs))
+
+async def test_health(session):
+    """Test 1: Health check"""
+    async with session.get("/health") as response:
         print("🔍 Testing health check...")
-        async with session.get(f"{base_url}/health") as response:
-            if response.status == 200:
-                health_data = await response.json()
-                print(f"✅ Health check passed: {health_data}")
-            else:
-                print(f"❌ Health check failed: {response.status}")
-                return
-        
-        # Test 2: Single translation
-        print("\n🌐 Testing single translation...")
-        translation_data = {
-            "text": "Hello, how are you today?",
-            "source_lang": "en",
-            "target_lang": "fr"
-        }
-        
-        async with session.post(
-            f"{base_url}/translate",
-            json=translation_data
-        ) as response:
-            if response.status == 200:
-                result = await response.json()
-                print(f"✅ Translation successful:")
-                print(f"   Original: {result['original_text']}")
-                print(f"   Translated: {result['translated_text']}")
-            else:
-                print(f"❌ Translation failed: {response.status}")
-                error_text = await response.text()
-                print(f"   Error: {error_text}")
-        
-        # Test 3: Batch translation
-        print("\n📦 Testing batch translation...")
-        batch_data = {
-            "texts": [
-                "The weather is beautiful today",
-                "I love this application",
-                "Thank you for your help"
-            ],
-            "source_lang": "en",
-            "target_lang": "fr"
-        }
-        
-        async with session.post(
-            f"{base_url}/translate/batch",
-            json=batch_data
-        ) as response:
-            if response.status == 200:
-                result = await response.json()
-                print(f"✅ Batch translation successful:")
-                for i, translation in enumerate(result['translations']):
-                    print(f"   {i+1}. '{translation['original_text']}' → '{translation['translated_text']}'")
-            else:
-                print(f"❌ Batch translation failed: {response.status}")
-                error_text = await response.text()
-                print(f"   Error: {error_text}")
+        print(f"   Protocol: HTTP/{response.version.major}.{response.version.minor}")
+        if response.status == 200:
+            health_data = await response.json()
+            print(f"✅ Health check passed: {health_data}")
+            return True
+        print(f"❌ Health check failed: {response.status}")
+        return False
+
+async def test_single(session):
+    """Test 2: Single translation"""
+    translation_data = {
+        "text": "Hello, how are you today?",
+        "source_lang": "en",
+        "target_lang": "fr"
+    }
+    
+    async with session.post(
+        "/translate",
+        json=translation_data
+    ) as response:
+        # Each test prints its whole block after its last await so concurrent
+        # tests do not interleave their output
+        if response.status == 200:
+            result = await response.json()
+            print("\n🌐 Testing single translation...")
+            print(f"✅ Translation successful:")
+            print(f"   Original: {result['original_text']}")
+            print(f"   Translated: {result['translated_text']}")
+        else:
+            error_text = await response.text()
+            print("\n🌐 Testing single translation...")
+            print(f"❌ Translation failed: {response.status}")
+            print(f"   Error: {error_text}")
+
+async def test_batch(session):
+    """Test 3: Batch translation"""
+    batch_data = {
+        "texts": [
+            "The weather is beautiful today",
+            "I love this application",
+            "Thank you for your help"
+        ],
+        "source_lang": "en",
+        "target_lang": "fr"
+    }
+    
+    async with session.post(
+        "/translate/batch",
+        json=batch_data
+    ) as response:
+        if response.status == 200:
+            result = await response.json()
+            print("\n📦 Testing batch translation...")
+            print(f"✅ Batch translation successful:")
+            for i, translation in enumerate(result['translations']):
+                print(f"   {i+1}. '{translation['original_text']}' → '{translation['translated_text']}'")
+        else:
+            error_text = await response.text()
+            print("\n📦 Testing batch translation...")
+            print(f"❌ Batch translation failed: {response.status}")
+            print(f"   Error: {error_text}")
+
+async def test_languages(session):
+    """Test 4: Get supported languages"""
+    async with session.get("/languages") as response:
+        if response.status == 200:
+            languages = await response.json()
+            print("\n🌍 Testing languages endpoint...")
+            print(f"✅ Languages: {languages}")
+        else:
+            print("\n🌍 Testing languages endpoint...")
+            print(f"❌ Languages endpoint failed: {response.status}")
+
+async def run_tests(session):
+    """Run the endpoint tests on one session"""
+    # The other tests are pointless against an unhealthy service
+    if not await test_health(session):
+        return
+    
+    # The remaining tests share no state, so overlap their round trips
+    await asyncio.gather(
+        test_single(session),
+        test_batch(session),
+        test_languages(session),
+    )
+
+async def test_translation_service(base_url=BASE_URL, http2=False):
+    """Test the translation service endpoints"""
+    
+    if http2:
+        # Every request is multiplexed as its own stream on a single HTTP/2
+        # connection; httpx only negotiates HTTP/2 over TLS
+        import httpx
         
-        # Test 4: Get supported languages
-        print("\n🌍 Testing languages endpoint...")
-        async with session.get(f"{base_url}/languages") as response:
-            if response.status == 200:
-                languages = await response.json()
-                print(f"✅ Languages: {languages}")
-            else:
-                print(f"❌ Languages endpoint failed: {response.status}")
+        async with httpx.AsyncClient(base_url=base_url, http2=True, timeout=30) as client:
+            await run_tests(_HttpxSession(client))
+        return
+    
+    # One session for every request, with a connector that keeps sockets alive
+    # so repeated requests reuse pooled connections instead of reconnecting
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=32, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=30)
+    
+    async with aiohttp.ClientSession(base_url=base_url, connector=connector, timeout=timeout) as session:
+        await run_tests(session)
 
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(description="Test the translation service endpoints")
+    parser.add_argument("--base-url", default=BASE_URL, help=f"Service URL (default: {BASE_URL})")
+    parser.add_argument("--http2", action="store_true", help="Send every request over one HTTP/2 connection with httpx")
+    args = parser.parse_args()
+    
+    # httpx only negotiates HTTP/2 over TLS and would silently fall back to HTTP/1.1
+    if args.http2 and not args.base_url.startswith("https://"):
+        parser.error("--http2 needs an https:// --base-url")
+    
     print("🚀 Starting translation service tests...")
-    print("Make sure the service is running on http://localhost:8002")
+    print(f"Make sure the service is running on {args.base_url}")
     print("=" * 50)
     
     try:
-        asyncio.run(test_translation_service())
+        asyncio.run(test_translation_service(args.base_url, args.http2))
     except aiohttp.ClientConnectorError:
-        print("❌ Could not connect to the service. Make sure it's running on http://localhost:8002")
+        print(f"❌ Could not connect to the service. Make sure it's running on {args.base_url}")
     except Exception as e:
         print(f"❌ Test failed with error: {e}")
     
@@ -0,0 +1,26 @@
+"""
+Shared fixtures for the translation service tests
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Test client for the app backed by a fake model, started once per session"""
+    import simple_app
+    
+    def fake_load_model(lang_code):
+        simple_app._loaded_languages.add(lang_code)
+    
+    def fake_translate_batch(texts, target_lang):
+        return [f"[{target_lang}] {text}" for text in texts]
+    
+    with pytest.MonkeyPatch.context() as mp:
+        # Replace model loading and inference so no model is downloaded
+        mp.setattr(simple_app, "_load_model_sync", fake_load_model)
+        mp.setattr(simple_app, "_translate_batch_sync", fake_translate_batch)
+        
+        with TestClient(simple_app.app) as test_client:
+            yield test_client
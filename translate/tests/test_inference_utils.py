@@ -0,0 +1,36 @@
+"""
+Tests for the shared inference helpers
+"""
+
+import os
+
+import pytest
+
+from inference_utils import model_cache_path, staged_directory
+
+def test_staged_directory_discards_interrupted_build(tmp_path):
+    """Test that a build that fails halfway leaves no output directory behind"""
+    output_dir = str(tmp_path / "onnx" / "model")
+    with pytest.raises(RuntimeError):
+        with staged_directory(output_dir) as staging_dir:
+            open(os.path.join(staging_dir, "encoder_model_quantized.onnx"), "w").close()
+            raise RuntimeError("killed while quantizing the decoder")
+    assert os.listdir(tmp_path / "onnx") == []
+
+def test_staged_directory_replaces_partial_output(tmp_path):
+    """Test that a completed build replaces a partial directory from an older run"""
+    output_dir = tmp_path / "onnx" / "model"
+    output_dir.mkdir(parents=True)
+    (output_dir / "encoder_model_quantized.onnx").write_text("partial")
+    with staged_directory(str(output_dir)) as staging_dir:
+        for name in ("encoder_model_quantized.onnx", "decoder_model_quantized.onnx"):
+            open(os.path.join(staging_dir, name), "w").close()
+    assert sorted(os.listdir(output_dir)) == ["decoder_model_quantized.onnx", "encoder_model_quantized.onnx"]
+    assert os.listdir(tmp_path / "onnx") == ["model"]
+
+def test_model_cache_path_honours_cache_dir(monkeypatch, tmp_path):
+    """Test that TRANSLATE_CACHE_DIR overrides the default cache directory"""
+    monkeypatch.delenv("TRANSLATE_CACHE_DIR", raising=False)
+    assert model_cache_path("onnx", "org/model", default_dir="/app/models") == "/app/models/onnx/org--model"
+    monkeypatch.setenv("TRANSLATE_CACHE_DIR", str(tmp_path))
+    assert model_cache_path("onnx", "org/model", default_dir="/app/models") == str(tmp_path / "onnx" / "org--model")
@@ -0,0 +1,20 @@
+"""
+Tests for the security helpers
+"""
+
+from security_config import sanitize_input
+
+def test_sanitize_input_strips_dangerous_patterns():
+    """Test that each dangerous pattern is removed"""
+    assert sanitize_input("JavaScript:alert(1)") == "alert(1)"
+    assert sanitize_input("vbscript:msgbox") == "msgbox"
+    assert sanitize_input("data:text/html,x") == ",x"
+
+def test_sanitize_input_escapes_html():
+    """Test that markup is HTML-escaped"""
+    assert sanitize_input(" <b>Hello</b> ") == "&lt;b&gt;Hello&lt;/b&gt;"
+
+def test_sanitize_input_applies_patterns_in_order():
+    """Test that a pattern exposed by removing an earlier one is caught by the later pass"""
+    assert sanitize_input("vbjavascript:script:alert(1)") == "alert(1)"
+    assert sanitize_input("datajavascript::text/html,x") == ",x"
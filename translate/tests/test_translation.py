@@ -2,13 +2,13 @@
 Tests for the translation service
 """
 
-import pytest
-from fastapi.testclient import TestClient
-from simple_app import app
+import os
+import subprocess
+import sys
 
-client = TestClient(app)
+import pytest
 
-def test_root_endpoint():
+def test_root_endpoint(client):
     """Test the root endpoint"""
     response = client.get("/")
     assert response.status_code == 200
@@ -17,15 +17,25 @@ def test_root_endpoint():
     assert "version" in data
     assert "models" in data
 
-def test_health_endpoint():
+def test_health_endpoint(client):
     """Test the health endpoint"""
     response = client.get("/health")
     assert response.status_code == 200
     data = response.json()
     assert "status" in data
     assert "models_loaded" in data
+    assert "loaded_languages" in data
+    assert data["models_loaded"] == (set(data["loaded_languages"]) == {"fr", "he"})
+    assert "translation_cache" in data
+    assert "hits" in data["translation_cache"]
+
+def test_cache_clear_endpoint(client):
+    """Test the cache clear endpoint"""
+    response = client.post("/cache/clear")
+    assert response.status_code == 200
+    assert client.get("/health").json()["translation_cache"]["currsize"] == 0
 
-def test_languages_endpoint():
+def test_languages_endpoint(client):
     """Test the languages endpoint"""
     response = client.get("/languages")
     assert response.status_code == 200
@@ -37,37 +47,56 @@ def test_languages_endpoint():
     assert "fr" in data["supported_languages"]["target"]
     assert "he" in data["supported_languages"]["target"]
 
-def test_translate_endpoint_missing_text():
+def test_translate_endpoint_missing_text(client):
     """Test translation endpoint with missing text"""
     response = client.get("/translate")
     assert response.status_code == 422  # FastAPI returns 422 for validation errors
 
-def test_translate_endpoint_with_text():
+def test_translate_endpoint_with_text(client):
     """Test translation endpoint with text"""
     response = client.get("/translate?text=Hello")
-    # This might return 503 if models are not loaded, or 500 if models fail to load
-    assert response.status_code in [200, 503, 500]
+    assert response.status_code == 200
+    assert response.json()["translated_text"] == "[fr] Hello"
+
+def test_translate_endpoint_unsupported_language(client):
+    """Test translation endpoint with an unsupported target language"""
+    response = client.get("/translate?text=Hello&target_lang=de")
+    assert response.status_code == 400
 
-def test_translate_post_endpoint():
+def test_translate_post_endpoint(client):
     """Test POST translation endpoint"""
-    response = client.post("/translate", json={"text": "Hello"})
-    # This might return 503 if models are not loaded, or 500 if models fail to load
-    assert response.status_code in [200, 503, 500]
+    response = client.post("/translate", json={"text": "Hello", "target_lang": "he"})
+    assert response.status_code == 200
+    assert response.json()["translated_text"] == "[he] Hello"
 
-def test_batch_translate_endpoint():
+def test_batch_translate_endpoint(client):
     """Test batch translation endpoint"""
-    response = client.post("/translate/batch", json={"texts": ["Hello", "World"]})
-    # This might return 503 if models are not loaded, or 500 if models fail to load
-    assert response.status_code in [200, 503, 500]
+    response = client.post("/translate/batch", json={"texts": ["Hello", "World", "Hello"]})
+    assert response.status_code == 200
+    translations = response.json()["translations"]
+    assert [t["original_text"] for t in translations] == ["Hello", "World", "Hello"]
+    assert [t["translated_text"] for t in translations] == ["[fr] Hello", "[fr] World", "[fr] Hello"]
 
-def test_quick_translate_endpoint():
+def test_quick_translate_endpoint(client):
     """Test quick translate endpoint"""
     response = client.get("/translate/quick")
-    # This might return 503 if models are not loaded, or 500 if models fail to load
-    assert response.status_code in [200, 503, 500]
+    assert response.status_code == 200
+    data = response.json()
+    assert data["translated_text"] == "[fr] " + data["original_text"]
 
-def test_quick_translate_hebrew_endpoint():
+def test_quick_translate_hebrew_endpoint(client):
     """Test quick Hebrew translate endpoint"""
     response = client.get("/translate/quick/hebrew")
-    # This might return 503 if models are not loaded, or 500 if models fail to load
-    assert response.status_code in [200, 503, 500]
+    assert response.status_code == 200
+    data = response.json()
+    assert data["translated_text"] == "[he] " + data["original_text"]
+
+def test_package_exports_app():
+    """Test that the app can be imported as translate.app from the repository root"""
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run(
+        [sys.executable, "-c", "import translate; print(type(translate.app).__name__)"],
+        cwd=repo_root, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "FastAPI"
@@ -0,0 +1,228 @@
+"""
+Tests for the TranslationService batching, caching, padding and streaming
+"""
+
+import asyncio
+import json
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+from translation_service import BUCKET_SIZE, TranslationService
+
+class StubTokenizer:
+    """Word-level tokenizer; decoding upper-cases the words back"""
+
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self):
+        self.vocab = {}
+        self.words = {}
+        self.calls = 0
+
+    def __call__(self, text, return_tensors=None, truncation=False, max_length=512):
+        self.calls += 1
+        ids = [self._id(word) for word in text.split()][:max_length - 1] + [self.eos_token_id]
+        return {"input_ids": torch.tensor([ids])}
+
+    def _id(self, word):
+        if word not in self.vocab:
+            self.vocab[word] = len(self.vocab) + 2
+            self.words[self.vocab[word]] = word
+        return self.vocab[word]
+
+    def decode(self, ids, skip_special_tokens=False):
+        ids = ids.tolist() if isinstance(ids, torch.Tensor) else ids
+        return " ".join(self.words[i].upper() for i in ids if i > self.eos_token_id)
+
+class StubModel:
+    """Echoes the unpadded input ids back and records every generate call"""
+
+    def __init__(self):
+        self.calls = []
+        self.fail_after = None
+
+    def generate(self, input_ids, attention_mask, streamer=None, **kwargs):
+        self.calls.append({"input_ids": input_ids, "attention_mask": attention_mask, **kwargs})
+        rows = [[0] + row[mask.bool()].tolist() for row, mask in zip(input_ids, attention_mask)]
+        if streamer is not None:
+            if kwargs.get("num_beams", 1) > 1:
+                raise ValueError("`streamer` cannot be used with beam search (yet!)")
+            for i in range(len(rows[0])):
+                if i == self.fail_after:
+                    raise RuntimeError("generation failed")
+                streamer.put(torch.tensor([rows[0][i]]))
+            streamer.end()
+        width = max(len(row) for row in rows)
+        return torch.tensor([row + [0] * (width - len(row)) for row in rows])
+
+def make_service(**kwargs) -> TranslationService:
+    """A service whose model loading installs the stubs"""
+    service = TranslationService(**kwargs)
+
+    def load_model():
+        service.tokenizer = StubTokenizer()
+        service.model = StubModel()
+
+    service._load_model = load_model
+    return service
+
+def run_with_service(test, **kwargs):
+    """Run an async test body against an initialized stub service"""
+    async def main():
+        service = make_service(**kwargs)
+        await service.initialize()
+        service.model.calls.clear()
+        try:
+            await test(service)
+        finally:
+            await service.shutdown()
+
+    asyncio.run(main())
+
+def test_translate_batch_preserves_order():
+    """Test that mixed-length texts come back in their original order"""
+    texts = [" ".join(["w%d" % i] * length) for i, length in enumerate([3, 12, 1, 7, 20, 2, 9, 5, 15, 4, 1])]
+
+    async def check(service):
+        translated = await service.translate_batch(texts)
+        assert translated == [text.upper() for text in texts]
+        assert len(service.model.calls) == -(-len(texts) // BUCKET_SIZE)
+
+    run_with_service(check)
+
+def test_generate_batch_pads_buckets_to_multiples_of_8():
+    """Test that every bucket is padded to a multiple of 8 with a matching mask"""
+    texts = [" ".join(["x"] * length) for length in [3, 12, 1, 7, 20, 2, 9, 5, 15, 4]]
+
+    async def check(service):
+        await service.translate_batch(texts)
+        for call in service.model.calls:
+            input_ids, attention_mask = call["input_ids"], call["attention_mask"]
+            assert input_ids.shape[1] % 8 == 0
+            assert attention_mask.shape == input_ids.shape
+            lengths = attention_mask.sum(dim=1)
+
+            # Buckets are length-sorted and the mask covers exactly the real tokens
+            assert lengths.tolist() == sorted(lengths.tolist())
+            for row, mask, length in zip(input_ids, attention_mask, lengths):
+                assert mask[:length].all() and not mask[length:].any()
+                assert (row[length:] == StubTokenizer.pad_token_id).all()
+
+    run_with_service(check)
+
+def test_decode_budget_ignores_padding():
+    """Test that max_new_tokens follows the longest real input, not the padded width"""
+    async def check(service):
+        await service.translate_batch(["short", "two words"])
+        call, = service.model.calls
+        assert call["input_ids"].shape[1] == 8
+        assert call["max_new_tokens"] == int(3 * 1.3) + 16
+
+    run_with_service(check)
+
+def test_tokenize_caches_token_ids():
+    """Test that a repeated text is only tokenized once"""
+    async def check(service):
+        calls = service.tokenizer.calls
+        await service.translate_batch(["hello world", "hello world"])
+        await service.translate_batch(["hello world"])
+        assert service.tokenizer.calls == calls + 1
+
+    run_with_service(check, cache_size=0)
+
+def test_concurrent_translate_calls_share_one_generate():
+    """Test that concurrent translate() calls are coalesced into one model call"""
+    texts = ["one", "two words", "three more words", "four"]
+
+    async def check(service):
+        translated = await asyncio.gather(*(service.translate(text) for text in texts))
+        assert translated == [text.upper() for text in texts]
+        assert len(service.model.calls) == 1
+
+    run_with_service(check, max_wait_ms=50)
+
+def test_translate_returns_cached_translation():
+    """Test that a cached translation skips the model"""
+    async def check(service):
+        assert await service.translate("hello") == "HELLO"
+        assert await service.translate("hello") == "HELLO"
+        assert len(service.model.calls) == 1
+
+    run_with_service(check)
+
+@pytest.fixture(scope="module")
+def stream_client():
+    """Test client for app.py backed by the stub model"""
+    import app as service_app
+
+    service = service_app.translation_service
+
+    def load_model():
+        service.tokenizer = StubTokenizer()
+        service.model = StubModel()
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(service, "_load_model", load_model)
+        with TestClient(service_app.app) as client:
+            yield client, service
+
+def sse_events(body):
+    """Parse a text/event-stream body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+def test_stream_endpoint_sends_pieces_then_done(stream_client):
+    """Test that a translation is streamed piece by piece and then closed"""
+    client, _ = stream_client
+    response = client.post("/translate/stream", json={"text": "hello big world"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert sse_events(response.text) == [
+        ("message", {"text": "HELLO "}),
+        ("message", {"text": "BIG "}),
+        ("message", {"text": "WORLD"}),
+        ("done", {}),
+    ]
+
+def test_stream_endpoint_sends_cached_translation_at_once(stream_client):
+    """Test that a cached translation is sent as a single piece"""
+    client, _ = stream_client
+    assert client.post("/translate", json={"text": "cached text"}).status_code == 200
+    response = client.post("/translate/stream", json={"text": "cached text"})
+    assert sse_events(response.text) == [("message", {"text": "CACHED TEXT"}), ("done", {})]
+
+def test_stream_endpoint_falls_back_for_beam_search(stream_client):
+    """Test that beam search sends the whole translation as one piece"""
+    client, service = stream_client
+    service.num_beams = 2
+    try:
+        response = client.post("/translate/stream", json={"text": "beam search text"})
+    finally:
+        service.num_beams = 1
+    assert sse_events(response.text) == [("message", {"text": "BEAM SEARCH TEXT"}), ("done", {})]
+
+def test_stream_endpoint_reports_generation_errors(stream_client):
+    """Test that a failure after streaming started is sent as an error event"""
+    client, service = stream_client
+    service.model.fail_after = 3
+    try:
+        response = client.post("/translate/stream", json={"text": "failing stream text"})
+    finally:
+        service.model.fail_after = None
+    assert response.status_code == 200
+    assert sse_events(response.text) == [
+        ("message", {"text": "FAILING "}),
+        ("error", {"detail": "Translation failed: generation failed"}),
+    ]
+
+def test_stream_endpoint_unsupported_language(stream_client):
+    """Test that an unsupported language pair fails before streaming starts"""
+    client, _ = stream_client
+    response = client.post("/translate/stream", json={"text": "hello", "target_lang": "de"})
+    assert response.status_code == 400
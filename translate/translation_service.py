@@ -1,31 +1,101 @@
 import asyncio
 import logging
 import os
-from transformers import MarianMTModel, MarianTokenizer
+from concurrent.futures import ThreadPoolExecutor
+from transformers import AutoTokenizer, MarianMTModel, PreTrainedTokenizerBase, TextStreamer
 import torch
-from typing import Optional
+from torch.nn.utils.rnn import pad_sequence
+from typing import AsyncIterator, Callable, Optional
+from inference_utils import DynamicBatcher, LRUCache, autocast, generation_kwargs, load_onnx_int8, model_cache_path
 
 logger = logging.getLogger(__name__)
 
+# Number of length-sorted texts translated per generate call in a batch
+BUCKET_SIZE = 8
+
+# Number of tokenized texts kept in memory
+TOKEN_CACHE_SIZE = 10000
+
+# Input lengths, in tokens, exercised once at startup
+WARMUP_LENGTHS = (8, 64, 256)
+
+def _cpu_supports_bf16() -> bool:
+    """Whether the CPU has native BF16 instructions (AVX512-BF16 / AMX)"""
+    check = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+    return bool(check and check())
+
+class _CallbackStreamer(TextStreamer):
+    """Hand each piece of decoded text to a callback as generate() produces it"""
+    
+    def __init__(self, tokenizer, on_text: Callable[[str], None]):
+        # skip_prompt drops the decoder start token generate() emits first
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self._on_text = on_text
+    
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self._on_text(text)
+
+def _retrieve_exception(future: asyncio.Future):
+    """Mark a future's exception as retrieved"""
+    if not future.cancelled():
+        future.exception()
+
 class TranslationService:
-    def __init__(self):
+    def __init__(self, backend: Optional[str] = None, max_batch_size: int = 16, max_wait_ms: float = 10,
+                 cache_size: int = 4096, num_beams: int = 1):
         self.model: Optional[MarianMTModel] = None
-        self.tokenizer: Optional[MarianTokenizer] = None
+        self.tokenizer: Optional[PreTrainedTokenizerBase] = None
         self.model_name = "Helsinki-NLP/opus-mt-en-fr"
+        # "torch" runs the PyTorch model, "onnx" an INT8 ONNX Runtime export of it
+        self.backend = (backend or os.getenv("TRANSLATE_BACKEND", "torch")).lower()
+        # Fixed for the life of the process; the ONNX Runtime model always runs on CPU
+        self._device = 'cuda' if self.backend != "onnx" and torch.cuda.is_available() else 'cpu'
         self._initialized = False
         
+        # All inference runs on one dedicated thread; torch parallelizes each call
+        # across the cores, so concurrent generate calls would only contend
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mt-infer")
+        
+        # Concurrent translate() calls are queued and coalesced into batches of up
+        # to max_batch_size texts, waiting at most max_wait_ms for the batch to fill
+        self._batcher = DynamicBatcher(
+            self._translate_batch_texts, self._executor, max_batch_size, max_wait_ms / 1000
+        )
+        
+        # Greedy decoding by default; callers can opt into beam search
+        self.num_beams = num_beams
+        
+        # Set when the model runs in BF16 on CPU
+        self._cpu_autocast = False
+        
+        # The uncompiled forward, kept while a compiled one has not run yet
+        self._eager_forward: Optional[Callable] = None
+        
+        # Translations keyed on the input text; one service serves one language pair
+        self._translation_cache = LRUCache(cache_size)
+        
+        # Token ids keyed on the input text, so repeated texts skip the tokenizer
+        self._token_cache = LRUCache(TOKEN_CACHE_SIZE)
+        
     async def initialize(self):
         """Initialize the translation model asynchronously"""
         try:
             logger.info(f"Loading model: {self.model_name}")
             
             # Run model loading in a thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             await loop.run_in_executor(None, self._load_model)
             
+            # Pay the first-call costs (CUDA context, kernel selection, compilation)
+            # before the service reports ready
+            await loop.run_in_executor(self._executor, self._warmup)
+            
             self._initialized = True
             logger.info("Model loaded successfully!")
             
+            self._batcher.start()
+            
         except Exception as e:
             logger.error(f"Failed to load model: {str(e)}")
             raise
@@ -33,72 +103,127 @@ class TranslationService:
     def _load_model(self):
         """Load the Hugging Face model and tokenizer from Artifactory"""
         try:
+            # Give the inference thread every core and keep torch from adding
+            # its own inter-op thread pool on top
+            torch.set_num_threads(os.cpu_count() or 1)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # Only allowed before any inter-op parallel work has started
+                logger.warning("Could not set the number of inter-op threads")
+            
             # Load tokenizer and model with caching and Artifactory configuration
             cache_dir = "/app/models" if os.path.exists("/app/models") else None
             
-            # Configure Hugging Face Hub to use Artifactory
-            import huggingface_hub
+            # huggingface_hub reads HF_ENDPOINT (e.g. an Artifactory remote) from the
+            # environment itself when it is imported
             hf_endpoint = os.getenv('HF_ENDPOINT')
-            hf_token = os.getenv('HF_TOKEN')
-            
-            if hf_endpoint and hf_token:
-                try:
-                    # Set the endpoint using the newer API
-                    if hasattr(huggingface_hub, 'set_http_backend'):
-                        huggingface_hub.set_http_backend(hf_endpoint)
-                        logger.info(f"Configured HF endpoint: {hf_endpoint}")
-                    elif hasattr(huggingface_hub, 'HfApi'):
-                        # Alternative approach using HfApi
-                        api = huggingface_hub.HfApi(endpoint=hf_endpoint)
-                        logger.info(f"Configured HF endpoint via HfApi: {hf_endpoint}")
-                    else:
-                        logger.warning("Could not configure HF endpoint - API not available")
-                except Exception as e:
-                    logger.warning(f"Could not configure HF endpoint: {e}")
+            if hf_endpoint:
+                logger.info(f"Using HF endpoint: {hf_endpoint}")
             else:
                 logger.info("Using public Hugging Face Hub")
             
-            # Load with token if available
+            # Authenticate when a token is set; None falls back to anonymous access
             token = os.getenv('HF_TOKEN')
-            if token:
-                self.tokenizer = MarianTokenizer.from_pretrained(
-                    self.model_name, 
-                    cache_dir=cache_dir,
-                    token=token,
-                    trust_remote_code=True
-                )
-                self.model = MarianMTModel.from_pretrained(
-                    self.model_name, 
-                    cache_dir=cache_dir,
-                    token=token,
-                    trust_remote_code=True
-                )
-            else:
-                self.tokenizer = MarianTokenizer.from_pretrained(
-                    self.model_name, 
-                    cache_dir=cache_dir,
-                    trust_remote_code=True
-                )
-                self.model = MarianMTModel.from_pretrained(
-                    self.model_name, 
-                    cache_dir=cache_dir,
-                    trust_remote_code=True
-                )
+            self.tokenizer = self._load_tokenizer(cache_dir, token)
+            if self.backend == "onnx":
+                self.model = self._load_onnx_model(cache_dir, token)
+                logger.info("Using ONNX Runtime INT8 model for inference")
+                return
+            
+            self.model = MarianMTModel.from_pretrained(
+                self.model_name, 
+                cache_dir=cache_dir,
+                token=token,
+                trust_remote_code=True
+            )
             
             # Set model to evaluation mode
             self.model.eval()
             
-            # Move to GPU if available
-            if torch.cuda.is_available():
-                self.model = self.model.to('cuda')
-                logger.info("Model moved to GPU")
+            # Move to GPU if available, halving the weights to use the FP16 tensor
+            # cores; on CPUs with native BF16 support run in BF16 instead
+            if self._device == 'cuda':
+                self.model = self.model.half().to('cuda')
+                logger.info("Model moved to GPU in FP16")
+            elif _cpu_supports_bf16():
+                self.model = self.model.to(torch.bfloat16)
+                self._cpu_autocast = True
+                logger.info("Using CPU for inference in BF16")
             else:
                 logger.info("Using CPU for inference")
+            
+            if os.getenv("TRANSLATE_COMPILE", "0") == "1":
+                try:
+                    # Compile forward rather than the module: generate() is looked
+                    # up on the original model and would bypass a compiled wrapper
+                    eager_forward = self.model.forward
+                    self.model.forward = torch.compile(eager_forward, mode="reduce-overhead")
+                    self._eager_forward = eager_forward
+                    logger.info("Model forward compiled with torch.compile")
+                except Exception as e:
+                    logger.warning(f"torch.compile failed, using eager mode: {e}")
                 
         except Exception as e:
             logger.error(f"Error loading model: {str(e)}")
             raise
     
+    def _load_tokenizer(self, cache_dir: Optional[str], token: Optional[str]) -> PreTrainedTokenizerBase:
+        """Load the Rust-backed fast tokenizer, falling back to the slow one if there is none"""
+        tokenizer = AutoTokenizer.from_pretrained(
+            self.model_name,
+            use_fast=True,
+            cache_dir=cache_dir,
+            token=token
+        )
+        if not tokenizer.is_fast:
+            logger.warning(f"No fast tokenizer available for {self.model_name}, using {type(tokenizer).__name__}")
+        return tokenizer
+    
+    def _warmup(self):
+        """Warm up the model, falling back to eager mode if compilation fails"""
+        try:
+            self._warmup_generate()
+        except Exception as e:
+            # torch.compile is lazy, so backend and toolchain failures only
+            # surface on the first compiled call made here
+            if self._eager_forward is None:
+                raise
+            logger.warning(f"torch.compile failed, using eager mode: {e}")
+            self.model.forward = self._eager_forward
+            self._eager_forward = None
+            self._warmup_generate()
+        self._eager_forward = None
+    
+    def _warmup_generate(self):
+        """Run short generations at a few representative input lengths"""
+        for length in WARMUP_LENGTHS:
+            # Same padding and decoding settings as real requests, so the warmed
+            # up kernels and compiled graphs are the ones production uses
+            input_ids = self._tokenize(" ".join(["warmup"] * length))[:length]
+            inputs = self._to_device(self._pad_batch([input_ids]))
+            kwargs = {**self._generation_kwargs(inputs), "max_new_tokens": 4}
+            with torch.inference_mode(), autocast(self._cpu_autocast):
+                self.model.generate(**inputs, **kwargs)
+        logger.info(f"Model warmed up for input lengths {WARMUP_LENGTHS}")
+    
+    def _load_onnx_model(self, cache_dir: Optional[str], token: Optional[str]):
+        """Load the INT8 ONNX Runtime model, exporting and quantizing it on first use"""
+        import onnxruntime
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        
+        # The image's /app/models (passed in as cache_dir) is preferred over
+        # ~/.cache/translate, but an explicit TRANSLATE_CACHE_DIR overrides both
+        onnx_dir = model_cache_path("onnx", self.model_name, default_dir=cache_dir)
+        
+        # Dynamic quantization targeting the AVX512-VNNI int8 kernels
+        quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = os.cpu_count() or 1
+        
+        return load_onnx_int8(self.model_name, onnx_dir, quantization_config, token, session_options)
+    
     def is_initialized(self) -> bool:
         """Check if the model is initialized"""
         return self._initialized and self.model is not None and self.tokenizer is not None
@@ -111,37 +236,93 @@ class TranslationService:
         if source_lang != "en" or target_lang != "fr":
             raise ValueError("Currently only English to French translation is supported")
         
+        # Cached translations skip the batch window and the inference thread
+        cached = self._translation_cache.get(text)
+        if cached is not None:
+            return cached
+        
         try:
-            # Run translation in a thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            translated_text = await loop.run_in_executor(None, self._translate_text, text)
-            return translated_text
+            # Queue the text so it shares a model call with concurrent requests
+            return await self._batcher.submit(text)
             
         except Exception as e:
             logger.error(f"Translation error: {str(e)}")
             raise
     
-    def _translate_text(self, text: str) -> str:
-        """Perform the actual translation"""
+    def translate_stream(self, text: str, source_lang: str = "en", target_lang: str = "fr") -> AsyncIterator[str]:
+        """Translate text, yielding pieces of the translation as they are decoded"""
+        if not self.is_initialized():
+            raise RuntimeError("Translation service not initialized")
+        
+        if source_lang != "en" or target_lang != "fr":
+            raise ValueError("Currently only English to French translation is supported")
+        
+        return self._stream_text(text)
+    
+    async def _stream_text(self, text: str) -> AsyncIterator[str]:
+        """Run a streaming generation on the inference executor and relay its pieces"""
+        cached = self._translation_cache.get(text)
+        if cached is not None:
+            yield cached
+            return
+        
+        if self.num_beams > 1:
+            # generate() cannot stream beam search, so send the whole translation
+            yield await self.translate(text)
+            return
+        
+        loop = asyncio.get_running_loop()
+        pieces: asyncio.Queue = asyncio.Queue()
+        
+        def on_text(piece: str):
+            loop.call_soon_threadsafe(pieces.put_nowait, piece)
+        
+        # Pieces are queued with call_soon_threadsafe before the future completes,
+        # so the end marker always lands after the last piece
+        future = loop.run_in_executor(self._executor, self._translate_text_streamed, text, on_text)
+        future.add_done_callback(lambda _: pieces.put_nowait(None))
+        
         try:
-            # Tokenize the input text
-            inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-            
-            # Move inputs to the same device as the model
-            if torch.cuda.is_available():
-                inputs = {k: v.to('cuda') for k, v in inputs.items()}
+            while True:
+                piece = await pieces.get()
+                if piece is None:
+                    break
+                yield piece
+        finally:
+            # If the client disconnects mid-stream nothing awaits the future, so
+            # retrieve its error here rather than leave it unreported
+            future.add_done_callback(_retrieve_exception)
+        
+        # Surface any generation error once the pieces are drained
+        await future
+    
+    async def shutdown(self):
+        """Stop the background batching task"""
+        await self._batcher.stop()
+    
+    def _generation_kwargs(self, inputs: dict) -> dict:
+        """generate() settings with a decoding budget proportional to the input length"""
+        # The longest real input, not the padded width _pad_batch rounds up to
+        input_len = int(inputs["attention_mask"].sum(dim=1).max())
+        return generation_kwargs(min(512, int(input_len * 1.3) + 16), self.num_beams)
+    
+    def _translate_text_streamed(self, text: str, on_text: Callable[[str], None]) -> str:
+        """Translate a single text, passing decoded pieces to on_text as they are generated"""
+        try:
+            inputs = self._to_device(self._pad_batch([self._tokenize(text)]))
+            streamer = _CallbackStreamer(self.tokenizer, on_text)
             
-            # Generate translation
-            with torch.no_grad():
-                translated = self.model.generate(**inputs)
+            with torch.inference_mode(), autocast(self._cpu_autocast):
+                translated = self.model.generate(
+                    **inputs, streamer=streamer, **self._generation_kwargs(inputs)
+                )
             
-            # Decode the translation
             translated_text = self.tokenizer.decode(translated[0], skip_special_tokens=True)
-            
+            self._translation_cache.put(text, translated_text)
             return translated_text
             
         except Exception as e:
-            logger.error(f"Error during translation: {str(e)}")
+            logger.error(f"Error during streamed translation: {str(e)}")
             raise
     
     async def translate_batch(self, texts: list, source_lang: str = "en", target_lang: str = "fr") -> list:
@@ -154,8 +335,8 @@ class TranslationService:
         
         try:
             # Run batch translation in a thread pool
-            loop = asyncio.get_event_loop()
-            translated_texts = await loop.run_in_executor(None, self._translate_batch_texts, texts)
+            loop = asyncio.get_running_loop()
+            translated_texts = await loop.run_in_executor(self._executor, self._translate_batch_texts, texts)
             return translated_texts
             
         except Exception as e:
@@ -165,22 +346,74 @@ class TranslationService:
     def _translate_batch_texts(self, texts: list) -> list:
         """Perform batch translation"""
         try:
-            # Tokenize all texts
-            inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
-            
-            # Move inputs to the same device as the model
-            if torch.cuda.is_available():
-                inputs = {k: v.to('cuda') for k, v in inputs.items()}
-            
-            # Generate translations
-            with torch.no_grad():
-                translated = self.model.generate(**inputs)
+            # Only run the model for texts that are not cached yet
+            translated_texts = [self._translation_cache.get(text) for text in texts]
+            misses = [i for i, translated_text in enumerate(translated_texts) if translated_text is None]
             
-            # Decode all translations
-            translated_texts = [self.tokenizer.decode(t, skip_special_tokens=True) for t in translated]
+            if misses:
+                generated = self._generate_batch([texts[i] for i in misses])
+                for i, translated_text in zip(misses, generated):
+                    translated_texts[i] = translated_text
+                    self._translation_cache.put(texts[i], translated_text)
             
             return translated_texts
             
         except Exception as e:
             logger.error(f"Error during batch translation: {str(e)}")
             raise
+    
+    def _generate_batch(self, texts: list) -> list:
+        """Run the model over texts in length-sorted buckets"""
+        # Tokenize every text once, without padding, to learn its length
+        encoded = [self._tokenize(text) for text in texts]
+        
+        # Sort by length and translate in buckets of similarly sized texts so
+        # little compute is spent on padding tokens
+        order = sorted(range(len(texts)), key=lambda i: len(encoded[i]))
+        translated_texts = [""] * len(texts)
+        
+        for start in range(0, len(order), BUCKET_SIZE):
+            bucket = order[start:start + BUCKET_SIZE]
+            inputs = self._pad_batch([encoded[i] for i in bucket])
+            
+            # Move inputs to the same device as the model
+            inputs = self._to_device(inputs)
+            
+            # Generate translations
+            with torch.inference_mode(), autocast(self._cpu_autocast):
+                translated = self.model.generate(**inputs, **self._generation_kwargs(inputs))
+            
+            # Decode back into the original positions
+            for i, tokens in zip(bucket, translated):
+                translated_texts[i] = self.tokenizer.decode(tokens, skip_special_tokens=True)
+        
+        return translated_texts
+
+    
+    def _to_device(self, inputs: dict) -> dict:
+        """Copy model inputs to the GPU from pinned memory so the copy runs asynchronously"""
+        if self._device == 'cuda':
+            inputs = {k: v.pin_memory().to('cuda', non_blocking=True) for k, v in inputs.items()}
+        return inputs
+    
+    def _tokenize(self, text: str) -> torch.Tensor:
+        """Token ids for a text, memoized so repeated texts skip the tokenizer"""
+        input_ids = self._token_cache.get(text)
+        if input_ids is None:
+            input_ids = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=512)["input_ids"][0]
+            self._token_cache.put(text, input_ids)
+        return input_ids
+    
+    def _pad_batch(self, sequences: list) -> dict:
+        """Pad token id tensors into a batch, rounding the length up to a multiple of 8"""
+        pad_token_id = self.tokenizer.pad_token_id
+        input_ids = pad_sequence(sequences, batch_first=True, padding_value=pad_token_id)
+        
+        # Aligned sequence lengths let the matmul kernels use full tiles
+        extra = -input_ids.shape[1] % 8
+        if extra:
+            input_ids = torch.nn.functional.pad(input_ids, (0, extra), value=pad_token_id)
+        
+        lengths = torch.tensor([len(sequence) for sequence in sequences])
+        attention_mask = (torch.arange(input_ids.shape[1])[None, :] < lengths[:, None]).long()
+        return {"input_ids": input_ids, "attention_mask": attention_mask}